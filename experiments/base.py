@@ -130,7 +130,7 @@ class Experiment(experiment.AbstractExperiment):
         which_loss = getattr(utils, self.config.which_loss)
         loss = which_loss(logits, y, reduction='mean')
         metrics = utils.topk_correct(logits, batch['labels'], prefix='train_')
-        metrics = jax.tree_map(jnp.mean, metrics)
+        metrics = jax.tree_util.tree_map(jnp.mean, metrics)
         metrics['train_loss'] = loss
         scaled_loss = loss / jax.device_count()
         return scaled_loss, metrics
@@ -138,10 +138,11 @@ class Experiment(experiment.AbstractExperiment):
     def _train_fn(self, params, opt_state, batch, global_step):
         grad_fn = jax.grad(self._loss_fn, argnums=0, has_aux=True)
         if self.config.dtype is jnp.bfloat16:
-            params = jax.tree_map(utils.to_bf16, params)
+            params = jax.tree_util.tree_map(utils.to_bf16, params)
         grads, metrics = grad_fn(params, batch)
         if self.config.dtype is jnp.bfloat16:
-            metrics, grads = jax.tree_map(utils.from_bf16, (metrics, grads))
+            metrics, grads = jax.tree_util.tree_map(utils.from_bf16,
+                                                    (metrics, grads))
 
         grads = jax.lax.psum(grads, 'i')
         metrics = jax.lax.pmean(metrics, 'i')
@@ -195,13 +196,15 @@ class Experiment(experiment.AbstractExperiment):
         for batch in self._build_eval_input():
             num_samples += np.prod(batch['labels'].shape[:2])
             metrics = self._eval_fn(params, batch)
-            metrics = jax.tree_map(lambda x: jnp.sum(x[0], axis=0), metrics)
+            metrics = jax.tree_util.tree_map(lambda x: jnp.sum(x[0], axis=0),
+                                             metrics)
             if summed_metrics is None:
                 summed_metrics = metrics
             else:
-                summed_metrics = jax.tree_multimap(jnp.add, summed_metrics,
-                                                   metrics)
-        mean_metrics = jax.tree_map(lambda x: x / num_samples, summed_metrics)
+                summed_metrics = jax.tree_util.tree_map(
+                    jnp.add, summed_metrics, metrics)
+        mean_metrics = jax.tree_util.tree_map(lambda x: x / num_samples,
+                                              summed_metrics)
         return jax.device_get(mean_metrics)
 
     def _eval_fn(self, params, batch):
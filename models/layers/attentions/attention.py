@@ -1,10 +1,12 @@
-from functools import partial
-from typing import Optional
+from typing import Callable, Optional
 
 from flax import linen as nn
+from einops import rearrange
+from jax import lax
 from jax import numpy as jnp
+from jax import random
 
-from models.layers.attentions import TalkingHeadsBlock
+from models.layers.attentions.flash_attention import flash_attention
 
 
 class AttentionBlock(nn.Module):
@@ -15,55 +17,138 @@ class AttentionBlock(nn.Module):
     attn_dropout_rate: float = 0.
     out_dropout_rate: float = 0.
     use_bias: bool = False
-    dtype: jnp.dtype = jnp.float32
-
-    @nn.compact
-    def __call__(self, inputs_q, inputs_kv, is_training: bool):
-        assert inputs_q.ndim == inputs_kv.ndim == 3
-
-        in_ch = inputs_q.shape[-1]
+    dtype: jnp.dtype = jnp.bfloat16
+    param_dtype: jnp.dtype = jnp.float32
+    softmax_dtype: jnp.dtype = jnp.float32
+    # Precision of the unfused attention matmuls. For float32 inputs HIGH is
+    # bf16_3x on TPU (three bf16 passes, where DEFAULT is one) and TF32 on GPU.
+    # It has no effect on bf16 inputs.
+    precision: lax.Precision = lax.Precision.HIGH
+    kernel_init: Callable = nn.initializers.lecun_normal()
+
+    def partitioned_kernel_init(self, *axes):
+        return nn.with_logical_partitioning(self.kernel_init, axes)
+
+    def dense(self, features, name):
+        # Leading (2, ...) / (3, ...) axes of fused projections are replicated.
+        fused_axes = (None,) * (len(features) - 2)
+        kernel_axes = ('embed',) + fused_axes + ('heads', 'kv')
+        return nn.DenseGeneral(axis=-1,
+                               features=features,
+                               use_bias=self.use_bias,
+                               dtype=self.dtype,
+                               param_dtype=self.param_dtype,
+                               kernel_init=self.partitioned_kernel_init(
+                                   *kernel_axes),
+                               name=name)
+
+    def channels(self, in_ch):
         assert in_ch % self.num_heads == 0
         head_ch = self.head_ch or int(in_ch / self.num_heads)
         out_ch = self.out_ch or in_ch
+        return head_ch, out_ch
 
-        dense = partial(nn.DenseGeneral,
-                        axis=-1,
-                        features=(self.num_heads, head_ch),
-                        use_bias=self.use_bias,
-                        dtype=self.dtype)
-
-        query = dense(name='queries')(inputs_q)
-        key = dense(name='keys')(inputs_kv)
-        value = dense(name='values')(inputs_kv)
-
-        query = query / jnp.sqrt(head_ch)
-
-        attn_weights = jnp.einsum('... q h d, ... k h d -> ... h q k', query,
-                                  key)
-
-        if self.talking_heads:
-            attn_weights = TalkingHeadsBlock(
-                num_heads=self.num_heads)(attn_weights)
-
-        attn_weights = nn.softmax(attn_weights)
-
-        if self.talking_heads:
-            attn_weights = TalkingHeadsBlock(
-                num_heads=self.num_heads)(attn_weights)
-
-        attn_weights = nn.Dropout(rate=self.attn_dropout_rate)(
-            attn_weights, deterministic=not is_training)
-
-        attn_scores = jnp.einsum('... h q k, ... k h d -> ... q h d',
-                                 attn_weights, value)
-
-        output = nn.DenseGeneral(features=out_ch,
-                                 axis=(-2, -1),
-                                 use_bias=self.use_bias,
-                                 dtype=self.dtype)(attn_scores)
-
-        output = nn.Dropout(rate=self.out_dropout_rate)(
-            output, deterministic=not is_training)
+    @nn.compact
+    def __call__(self, inputs_q, inputs_kv, is_training: bool):
+        assert inputs_q.ndim == inputs_kv.ndim == 3
+        head_ch, out_ch = self.channels(inputs_q.shape[-1])
+
+        query = self.dense((self.num_heads, head_ch), name='queries')(inputs_q)
+        key_value = self.dense((2, self.num_heads, head_ch),
+                               name='keys_values')(inputs_kv)
+        key, value = key_value[..., 0, :, :], key_value[..., 1, :, :]
+
+        return self.attend(query, key, value, out_ch, is_training=is_training)
+
+    def attend(self, query, key, value, out_ch: int, is_training: bool):
+        scale = float(query.shape[-1])**-0.5
+
+        use_attn_dropout = is_training and self.attn_dropout_rate > 0.
+        if not self.talking_heads and not use_attn_dropout:
+            attn_scores = flash_attention(query,
+                                          key,
+                                          value,
+                                          sm_scale=scale)
+        else:
+            if self.talking_heads:
+                transform_shape = (self.num_heads, self.num_heads)
+                pre_softmax_transform = self.param(
+                    'pre_softmax_transform', nn.initializers.orthogonal(),
+                    transform_shape, self.param_dtype)
+                post_softmax_transform = self.param(
+                    'post_softmax_transform', nn.initializers.orthogonal(),
+                    transform_shape, self.param_dtype)
+                pre_softmax_transform = pre_softmax_transform.astype(
+                    self.dtype)
+                post_softmax_transform = post_softmax_transform.astype(
+                    self.dtype)
+
+                attn_weights = scale * jnp.einsum(
+                    '... q h d, ... k h d, h i -> ... i q k',
+                    query,
+                    key,
+                    pre_softmax_transform,
+                    precision=self.precision,
+                    optimize='optimal')
+            else:
+                # (b, q, h, d) x (b, k, h, d) -> (b, h, q, k) as a batched GEMM.
+                attn_weights = scale * lax.dot_general(
+                    query,
+                    key,
+                    dimension_numbers=(((3,), (3,)), ((0, 2), (0, 2))),
+                    precision=self.precision)
+
+            attn_weights = nn.softmax(attn_weights.astype(self.softmax_dtype))
+            attn_weights = attn_weights.astype(self.dtype)
+
+            if self.talking_heads and not use_attn_dropout:
+                attn_scores = jnp.einsum(
+                    '... i q k, i h, ... k h d -> ... q h d',
+                    attn_weights,
+                    post_softmax_transform,
+                    value,
+                    precision=self.precision,
+                    optimize='optimal')
+            else:
+                if self.talking_heads:
+                    # Dropout acts on the mixed weights, so the mix can't be
+                    # folded into the value contraction here.
+                    attn_weights = jnp.einsum('... h q k, h i -> ... i q k',
+                                              attn_weights,
+                                              post_softmax_transform,
+                                              precision=self.precision)
+
+                if use_attn_dropout:
+                    # Inline rather than nn.Dropout so the mask is applied in
+                    # the same elementwise fusion as the softmax.
+                    keep_prob = 1. - self.attn_dropout_rate
+                    mask = random.bernoulli(self.make_rng('dropout'),
+                                            keep_prob, attn_weights.shape)
+                    attn_weights = jnp.where(mask, attn_weights / keep_prob,
+                                             0.)
+
+                # (b, h, q, k) x (b, k, h, d) -> (b, h, q, d)
+                attn_scores = lax.dot_general(
+                    attn_weights,
+                    value,
+                    dimension_numbers=(((3,), (1,)), ((0, 1), (0, 2))),
+                    precision=self.precision)
+                attn_scores = attn_scores.swapaxes(1, 2)
+
+        # A plain 2D GEMM over the merged heads rather than a two-axis
+        # DenseGeneral contraction.
+        attn_scores = rearrange(attn_scores, '... h d -> ... (h d)')
+        output = nn.Dense(features=out_ch,
+                          use_bias=self.use_bias,
+                          dtype=self.dtype,
+                          param_dtype=self.param_dtype,
+                          kernel_init=self.partitioned_kernel_init(
+                              'heads', 'embed'),
+                          name='out')(attn_scores)
+
+        if self.out_dropout_rate > 0.:
+            output = nn.Dropout(rate=self.out_dropout_rate)(
+                output, deterministic=not is_training)
         return output
 
 
@@ -71,4 +156,10 @@ class SelfAttentionBlock(AttentionBlock):
 
     @nn.compact
     def __call__(self, inputs, is_training: bool):
-        return super().__call__(inputs, inputs, is_training=is_training)
+        assert inputs.ndim == 3
+        head_ch, out_ch = self.channels(inputs.shape[-1])
+
+        qkv = self.dense((3, self.num_heads, head_ch), name='qkv')(inputs)
+        query, key, value = (qkv[..., i, :, :] for i in range(3))
+
+        return self.attend(query, key, value, out_ch, is_training=is_training)
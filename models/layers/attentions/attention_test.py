@@ -0,0 +1,58 @@
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import chex
+import jax.numpy as jnp
+import jax.random as random
+
+from models.layers import SelfAttentionBlock
+
+
+class SelfAttentionBlockTest(parameterized.TestCase):
+
+    @parameterized.named_parameters(('dot-product', False),
+                                    ('talking-heads', True))
+    def test_attn_dropout(self, talking_heads):
+        model = SelfAttentionBlock(num_heads=4,
+                                   talking_heads=talking_heads,
+                                   attn_dropout_rate=0.1,
+                                   dtype=jnp.float32)
+        x = random.normal(random.PRNGKey(0), (2, 16, 32))
+        variables = model.init(dict(params=random.PRNGKey(1)),
+                               x,
+                               is_training=False)
+
+        output_0 = model.apply(variables,
+                               x,
+                               is_training=True,
+                               rngs=dict(dropout=random.PRNGKey(2)))
+        output_1 = model.apply(variables,
+                               x,
+                               is_training=True,
+                               rngs=dict(dropout=random.PRNGKey(3)))
+        chex.assert_shape(output_0, (2, 16, 32))
+        self.assertFalse(jnp.allclose(output_0, output_1))
+
+    @parameterized.named_parameters(('dot-product', False),
+                                    ('talking-heads', True))
+    def test_fused_matches_unfused(self, talking_heads):
+        x = random.normal(random.PRNGKey(0), (2, 16, 32))
+        fused = SelfAttentionBlock(num_heads=4,
+                                   talking_heads=talking_heads,
+                                   dtype=jnp.float32)
+        variables = fused.init(dict(params=random.PRNGKey(1)),
+                               x,
+                               is_training=False)
+
+        # Any active attention dropout routes through the unfused path.
+        unfused = fused.clone(attn_dropout_rate=1e-9)
+        eval_output = fused.apply(variables, x, is_training=False)
+        train_output = unfused.apply(variables,
+                                     x,
+                                     is_training=True,
+                                     rngs=dict(dropout=random.PRNGKey(2)))
+        chex.assert_trees_all_close(eval_output, train_output, atol=1e-5)
+
+
+if __name__ == '__main__':
+    absltest.main()
@@ -0,0 +1,70 @@
+import jax
+from jax import numpy as jnp
+
+BLOCK_SIZE = 128
+
+
+def _cudnn_supported(query) -> bool:
+    # cuDNN fused attention needs half-precision inputs and an Ampere or newer
+    # CUDA device; ROCm reports an arch string like 'gfx90a' instead.
+    head_ch = query.shape[-1]
+    if (query.dtype not in (jnp.bfloat16, jnp.float16) or head_ch > 128 or
+            head_ch % 8 != 0):
+        return False
+
+    device = jax.devices()[0]
+    if 'cuda' not in device.client.platform_version:
+        return False
+    compute_capability = tuple(
+        int(v) for v in device.compute_capability.split('.'))
+    return compute_capability >= (8, 0)
+
+
+def _pad_to_block(x):
+    seq_len = x.shape[1]
+    padded_len = -(-seq_len // BLOCK_SIZE) * BLOCK_SIZE
+    return jnp.pad(x, ((0, 0), (0, padded_len - seq_len), (0, 0), (0, 0)))
+
+
+def tpu_flash_attention(query, key, value, sm_scale: float, kernel=None):
+    # query, key, value: (b, n, h, d)
+    from jax.experimental.pallas.ops.tpu import flash_attention as tpu_attention
+    kernel = kernel or tpu_attention.flash_attention
+
+    b, q_len = query.shape[:2]
+    kv_len = key.shape[1]
+    query, key, value = (_pad_to_block(x) for x in (query, key, value))
+
+    segment_ids = None
+    if query.shape[1] != q_len or key.shape[1] != kv_len:
+        # Padded keys get their own segment so no query attends to them;
+        # padded queries stay in the real segment and are sliced off below.
+        q_segment_ids = jnp.ones((b, query.shape[1]), dtype=jnp.int32)
+        kv_segment_ids = jnp.arange(key.shape[1]) < kv_len
+        kv_segment_ids = jnp.broadcast_to(kv_segment_ids.astype(jnp.int32),
+                                          (b, key.shape[1]))
+        segment_ids = tpu_attention.SegmentIds(q=q_segment_ids,
+                                               kv=kv_segment_ids)
+
+    query, key, value = (x.swapaxes(1, 2) for x in (query, key, value))
+    output = kernel(query, key, value, None, segment_ids, sm_scale=sm_scale)
+    return output.swapaxes(1, 2)[:, :q_len]
+
+
+def flash_attention(query, key, value, sm_scale: float):
+    # query, key, value: (b, n, h, d)
+    backend = jax.default_backend()
+
+    if backend == 'tpu':
+        return tpu_flash_attention(query, key, value, sm_scale=sm_scale)
+
+    if backend == 'gpu' and _cudnn_supported(query):
+        implementation = 'cudnn'
+    else:
+        implementation = 'xla'
+    return jax.nn.dot_product_attention(query,
+                                        key,
+                                        value,
+                                        scale=sm_scale,
+                                        is_causal=False,
+                                        implementation=implementation)
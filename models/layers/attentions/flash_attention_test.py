@@ -0,0 +1,41 @@
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import chex
+import jax
+import jax.random as random
+from jax.experimental.pallas.ops.tpu import flash_attention as tpu_attention
+
+from models.layers.attentions.flash_attention import tpu_flash_attention
+
+
+class TPUFlashAttentionTest(parameterized.TestCase):
+
+    @parameterized.named_parameters(('block-multiple', 128, 128),
+                                    ('cls-token', 197, 197),
+                                    ('cross-attention', 1, 197))
+    def test_padding_matches_unfused(self, q_len, kv_len):
+        q_rng, k_rng, v_rng = random.split(random.PRNGKey(0), 3)
+        query = random.normal(q_rng, (2, q_len, 4, 32))
+        key = random.normal(k_rng, (2, kv_len, 4, 32))
+        value = random.normal(v_rng, (2, kv_len, 4, 32))
+        sm_scale = 32**-0.5
+
+        # The reference kernel takes the same arguments as the Pallas kernel
+        # and applies the segment mask, so the padding logic runs on CPU.
+        output = tpu_flash_attention(query,
+                                     key,
+                                     value,
+                                     sm_scale=sm_scale,
+                                     kernel=tpu_attention.mha_reference)
+        expected = jax.nn.dot_product_attention(query,
+                                                key,
+                                                value,
+                                                scale=sm_scale,
+                                                implementation='xla')
+        chex.assert_shape(output, (2, q_len, 4, 32))
+        chex.assert_trees_all_close(output, expected, atol=1e-5)
+
+
+if __name__ == '__main__':
+    absltest.main()
@@ -11,6 +11,10 @@ class FFBlock(nn.Module):
     dropout_rate: float = 0.
     activation_fn: Callable = nn.activation.gelu
     dtype: jnp.dtype = jnp.float32
+    kernel_init: Callable = nn.initializers.lecun_normal()
+
+    def partitioned_kernel_init(self, *axes):
+        return nn.with_logical_partitioning(self.kernel_init, axes)
 
     @nn.compact
     def __call__(self, inputs, is_training: bool):
@@ -25,10 +29,13 @@ class FFBlock(nn.Module):
 
         dense = partial(nn.Dense, use_bias=True, dtype=self.dtype)
 
-        x = dense(features=hidden_ch)(inputs)
+        x = dense(features=hidden_ch,
+                  kernel_init=self.partitioned_kernel_init('embed',
+                                                           'mlp'))(inputs)
         x = self.activation_fn(x)
         x = nn.Dropout(rate=self.dropout_rate, deterministic=not is_training)(x)
-        x = dense(features=in_ch)(x)
+        x = dense(features=in_ch,
+                  kernel_init=self.partitioned_kernel_init('mlp', 'embed'))(x)
         output = nn.Dropout(rate=self.dropout_rate,
                             deterministic=not is_training)(x)
         return output
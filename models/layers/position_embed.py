@@ -47,11 +47,13 @@ class RotaryPositionalEmbedding(FixedPositionalEmbedding):
 
 class AddAbsPosEmbed(nn.Module):
     embed_init: Callable = nn.initializers.normal(stddev=0.02)
+    dtype: jnp.dtype = jnp.float32
 
     @nn.compact
     def __call__(self, inputs):
         assert inputs.ndim == 3
         pos_emb_shape = (1, inputs.shape[1], inputs.shape[2])
         pos_emb = self.param('pos_embed', self.embed_init, pos_emb_shape)
+        pos_emb = jnp.asarray(pos_emb, self.dtype)
         output = inputs + pos_emb
         return output
@@ -1,5 +1,6 @@
 from typing import Tuple, Callable
 
+import jax
 from flax import linen as nn
 from jax import numpy as jnp
 
@@ -12,18 +13,18 @@ class EncoderBlock(nn.Module):
     attn_dropout_rate: float = 0.
     dropout_rate: float = 0.
     activation_fn: Callable = nn.activation.gelu
-    dtype: jnp.dtype = jnp.float32
+    dtype: jnp.dtype = jnp.bfloat16
 
     @nn.compact
     def __call__(self, inputs, is_training: bool):
-        x = nn.LayerNorm(dtype=self.dtype)(inputs)
+        x = nn.RMSNorm(dtype=self.dtype, param_dtype=jnp.float32)(inputs)
         x = SelfAttentionBlock(num_heads=self.num_heads,
                                attn_dropout_rate=self.attn_dropout_rate,
                                out_dropout_rate=self.dropout_rate,
                                dtype=self.dtype)(x, is_training=is_training)
         x = x + inputs
 
-        y = nn.LayerNorm(dtype=self.dtype)(x)
+        y = nn.RMSNorm(dtype=self.dtype, param_dtype=jnp.float32)(x)
         y = FFBlock(expand_ratio=self.expand_ratio,
                     dropout_rate=self.dropout_rate,
                     activation_fn=self.activation_fn,
@@ -39,22 +40,42 @@ class Encoder(nn.Module):
     attn_dropout_rate: float = 0.
     dropout_rate: float = 0.
     activation_fn: Callable = nn.activation.gelu
-    dtype: jnp.dtype = jnp.float32
+    dtype: jnp.dtype = jnp.bfloat16
 
     @nn.compact
     def __call__(self, inputs, is_training: bool):
-        x = AddAbsPosEmbed()(inputs)
-        x = nn.Dropout(rate=self.dropout_rate)(x, deterministic=not is_training)
-
-        for _ in range(self.num_layers):
-            x = EncoderBlock(num_heads=self.num_heads,
-                             expand_ratio=self.expand_ratio,
-                             attn_dropout_rate=self.attn_dropout_rate,
-                             dropout_rate=self.dropout_rate,
-                             activation_fn=self.activation_fn,
-                             dtype=self.dtype)(x, is_training=is_training)
-
-        output = nn.LayerNorm(dtype=self.dtype)(x)
+        x = AddAbsPosEmbed(dtype=self.dtype)(inputs)
+        if self.dropout_rate > 0.:
+            x = nn.Dropout(rate=self.dropout_rate)(x,
+                                                   deterministic=not is_training)
+
+        def apply_block(block, x, _):
+            return block(x, is_training=is_training), None
+
+        # Trace a single block and scan it over the stacked layer parameters.
+        # Only matmul outputs are kept for the backward pass; softmax and
+        # activations are recomputed.
+        apply_block = nn.remat(
+            apply_block,
+            policy=jax.checkpoint_policies.dots_with_no_batch_dims_saveable,
+            prevent_cse=False)
+        blocks = nn.scan(apply_block,
+                         variable_axes={'params': 0},
+                         split_rngs={
+                             'params': True,
+                             'dropout': True
+                         },
+                         length=self.num_layers,
+                         metadata_params={nn.PARTITION_NAME: 'layers'})
+        x, _ = blocks(
+            EncoderBlock(num_heads=self.num_heads,
+                         expand_ratio=self.expand_ratio,
+                         attn_dropout_rate=self.attn_dropout_rate,
+                         dropout_rate=self.dropout_rate,
+                         activation_fn=self.activation_fn,
+                         dtype=self.dtype), x, None)
+
+        output = nn.LayerNorm(dtype=jnp.float32, param_dtype=jnp.float32)(x)
         return output
 
 
@@ -68,20 +89,22 @@ class ViT(nn.Module):
     attn_dropout_rate: float = 0.
     dropout_rate: float = 0.
     activation_fn: Callable = nn.activation.gelu
-    dtype: jnp.dtype = jnp.float32
+    dtype: jnp.dtype = jnp.bfloat16
 
     @nn.compact
     def __call__(self, inputs, is_training: bool):
         assert self.embed_dim % self.num_heads == 0
+        inputs = inputs.astype(self.dtype)
 
         x = PatchEmbedBlock(patch_shape=self.patch_shape,
                             embed_dim=self.embed_dim,
                             dtype=self.dtype)(inputs)
 
-        b, l, _ = x.shape
+        b = x.shape[0]
         cls_shape = (1, 1, self.embed_dim)
         cls_token = self.param('cls', nn.initializers.zeros, cls_shape)
-        cls_token = jnp.tile(cls_token, [b, 1, 1])
+        cls_token = jnp.asarray(cls_token, self.dtype)
+        cls_token = jnp.broadcast_to(cls_token, (b, 1, self.embed_dim))
         x = jnp.concatenate([cls_token, x], axis=1)
 
         x = Encoder(num_layers=self.num_layers,
@@ -92,8 +115,8 @@ class ViT(nn.Module):
                     activation_fn=self.activation_fn,
                     dtype=self.dtype)(x, is_training=is_training)
 
-        cls_token = x[:, 0]
+        cls_token = jax.lax.index_in_dim(x, 0, axis=1, keepdims=False)
         output = nn.Dense(features=self.num_classes,
-                          dtype=self.dtype,
+                          dtype=jnp.float32,
                           kernel_init=nn.initializers.zeros)(cls_token)
         return output
@@ -6,6 +6,7 @@ import jax.numpy as jnp
 import jax.random as random
 
 from models import ViT
+from models.vit import Encoder
 
 
 class ViTTest(parameterized.TestCase):
@@ -25,6 +26,53 @@ class ViTTest(parameterized.TestCase):
         logits, _ = model.init_with_output(rng, x, is_training=True)
         chex.assert_shape(logits, (2, num_classes))
 
+    def test_compute_dtype(self):
+        model = ViT(num_classes=10,
+                    num_layers=2,
+                    num_heads=4,
+                    embed_dim=64,
+                    patch_shape=(16, 16),
+                    dtype=jnp.bfloat16)
+        x = jnp.ones((2, 64, 64, 3))
+        variables = model.init(dict(params=random.PRNGKey(0)),
+                               x,
+                               is_training=False)
+        _, state = model.apply(variables,
+                               x,
+                               is_training=False,
+                               capture_intermediates=True,
+                               mutable=['intermediates'])
+
+        # The sequence entering the scanned encoder blocks stays in bf16.
+        intermediates = state['intermediates']
+        pos_embedded, = intermediates['Encoder_0']['AddAbsPosEmbed_0'][
+            '__call__']
+        self.assertEqual(pos_embedded.dtype, jnp.bfloat16)
+
+    def test_encoder_dropout(self):
+        model = Encoder(num_layers=2,
+                        num_heads=4,
+                        attn_dropout_rate=0.1,
+                        dropout_rate=0.1)
+        x = random.normal(random.PRNGKey(0), (2, 16, 32))
+        variables = model.init(dict(params=random.PRNGKey(1)),
+                               x,
+                               is_training=False)
+
+        def apply_train(dropout_rng):
+            return model.apply(variables,
+                               x,
+                               is_training=True,
+                               rngs=dict(dropout=dropout_rng))
+
+        output_0 = apply_train(random.PRNGKey(2))
+        output_1 = apply_train(random.PRNGKey(3))
+        eval_output = model.apply(variables, x, is_training=False)
+
+        chex.assert_shape(output_0, (2, 16, 32))
+        self.assertFalse(jnp.allclose(output_0, output_1))
+        self.assertFalse(jnp.allclose(output_0, eval_output))
+
 
 if __name__ == '__main__':
     absltest.main()
@@ -0,0 +1,39 @@
+from functools import partial
+
+import jax
+import numpy as np
+from flax import linen as nn
+from jax.sharding import Mesh, PartitionSpec as P
+
+# Maps the logical axis names used by the model kernels onto a
+# ('data', 'model') mesh: attention heads and MLP hidden units are split
+# across the model axis, everything else is replicated.
+LOGICAL_AXIS_RULES = (
+    ('batch', 'data'),
+    ('layers', None),
+    ('embed', None),
+    ('heads', 'model'),
+    ('kv', None),
+    ('mlp', 'model'),
+)
+
+
+def create_mesh(model_parallelism: int = 1):
+    devices = np.asarray(jax.devices())
+    devices = devices.reshape(-1, model_parallelism)
+    return Mesh(devices, ('data', 'model'))
+
+
+def variable_shardings(variables, mesh):
+    specs = nn.get_partition_spec(variables)
+    return nn.logical_to_mesh_sharding(specs, mesh, LOGICAL_AXIS_RULES)
+
+
+def sharded_apply(model, variables, mesh, is_training: bool = False):
+    image_sharding, logits_sharding = nn.logical_to_mesh_sharding(
+        (P('batch', None, None, None), P('batch', None)), mesh,
+        LOGICAL_AXIS_RULES)
+    return jax.jit(partial(model.apply, is_training=is_training),
+                   in_shardings=(variable_shardings(variables, mesh),
+                                 image_sharding),
+                   out_shardings=logits_sharding)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+from absl.testing import absltest
+
+import chex
+import jax
+import jax.numpy as jnp
+import jax.random as random
+from flax.core import unfreeze
+
+import sharding
+from models import ViT
+
+NUM_DEVICES = 4
+
+
+def check_sharded_apply():
+    assert jax.device_count() == NUM_DEVICES, jax.devices()
+
+    model = ViT(num_classes=10,
+                num_layers=2,
+                num_heads=4,
+                embed_dim=64,
+                patch_shape=(16, 16),
+                dtype=jnp.float32)
+    x = random.normal(random.PRNGKey(0), (4, 64, 64, 3))
+    variables = unfreeze(
+        model.init(dict(params=random.PRNGKey(1)), x, is_training=False))
+    # The classifier head is zero-initialized; randomize it so the logits
+    # depend on the sharded encoder.
+    head = variables['params']['Dense_0']
+    head['kernel'] = random.normal(random.PRNGKey(2), head['kernel'].shape)
+
+    mesh = sharding.create_mesh(model_parallelism=2)
+    assert mesh.devices.shape == (2, 2), mesh.devices.shape
+
+    variables = jax.device_put(variables,
+                               sharding.variable_shardings(variables, mesh))
+    qkv = variables['params']['Encoder_0']['EncoderBlock_0'][
+        'SelfAttentionBlock_0']['qkv']['kernel'].value
+    assert qkv.sharding.spec[3] == 'model', qkv.sharding.spec
+
+    logits = sharding.sharded_apply(model, variables, mesh)(variables, x)
+
+    chex.assert_shape(logits, (4, 10))
+    chex.assert_trees_all_close(logits,
+                                model.apply(variables, x, is_training=False),
+                                rtol=1e-5,
+                                atol=1e-4)
+
+
+class ShardingTest(absltest.TestCase):
+
+    def test_sharded_apply(self):
+        # Host device count is fixed when jax initializes its backend, so the
+        # multi-device check runs in a fresh interpreter.
+        env = dict(os.environ)
+        env['XLA_FLAGS'] = (env.get('XLA_FLAGS', '') +
+                            f' --xla_force_host_platform_device_count='
+                            f'{NUM_DEVICES}')
+        env['JAX_PLATFORMS'] = 'cpu'
+        result = subprocess.run(
+            [
+                sys.executable, '-c',
+                'import sharding_test; sharding_test.check_sharded_apply()'
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    absltest.main()
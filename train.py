@@ -23,7 +23,7 @@ def create_train_state(rng, model, img_size, lr_schedule_fn, weight_decay,
                        max_norm):
 
     tx = optax.chain(optax.clip_by_global_norm(max_norm), optax.scale_by_adam(),
-                     optax.additive_weight_decay(weight_decay),
+                     optax.add_decayed_weights(weight_decay),
                      optax.scale_by_schedule(lr_schedule_fn))
 
     params = model.init(rng,
@@ -96,7 +96,7 @@ def train_step(train_state, batch, label_smoothing):
     grads = jax.lax.pmean(grads, axis_name='batch')
     loss, logits = aux
     top_k_acc = utils.topk_correct(logits, batch['labels'], prefix='train_')
-    top_k_acc = jax.tree_map(jnp.mean, top_k_acc)
+    top_k_acc = jax.tree_util.tree_map(jnp.mean, top_k_acc)
     new_train_state = train_state.apply_gradients(grads=grads)
 
     if jax.process_index() == 0:
@@ -122,7 +122,8 @@ def eval_step(train_state, batch):
 
 def save_checkpoint(train_state, dir):
     if jax.process_index() == 0:
-        train_state = jax.device_get(jax.tree_map(lambda x: x[0], train_state))
+        train_state = jax.device_get(
+            jax.tree_util.tree_map(lambda x: x[0], train_state))
         step = int(train_state.step)
         checkpoints.save_checkpoint(dir, train_state, step, keep=3)
 
@@ -245,9 +246,10 @@ def main(data_dir, img_size, num_epochs, batch_size, label_smoothing,
                 if sum_loss is None:
                     sum_loss = loss
                 else:
-                    sum_loss = jax.tree_multimap(jnp.add, sum_loss, loss)
+                    sum_loss = jax.tree_util.tree_map(jnp.add, sum_loss, loss)
 
-            mean_loss = jax.tree_map(lambda x: x / num_samples, sum_loss)
+            mean_loss = jax.tree_util.tree_map(lambda x: x / num_samples,
+                                               sum_loss)
             if jax.process_index() == 0:
                 wandb.log({'eval/loss': float(mean_loss)}, train_state.step)
 